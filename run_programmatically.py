@@ -14,10 +14,19 @@ async def main():
 
     tiny_agent_config = get_tiny_agent_config(config_path=str(config_path))
     tiny_agent = TinyAgent(tiny_agent_config)
-    await tiny_agent.arun(
-        query="Write a notes with the Carbonara recipe "
-              " and then write the route how to get to the origin of Spaghetti Carbonara."
+    results = await tiny_agent.abatch(
+        queries=[
+            "Write a notes with the Carbonara recipe "
+            " and then write the route how to get to the origin of Spaghetti Carbonara.",
+            "Find Alice's email address.",
+        ]
     )
+    await tiny_agent.aclose()
+
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+        print(result)
 
 
 if __name__ == "__main__":
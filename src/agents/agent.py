@@ -1,19 +1,26 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
+import operator
+import re
 from abc import abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
+from string import Formatter
 from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import yaml
 from langchain.agents.agent import AgentOutputParser, BaseSingleActionAgent
 from langchain.agents.agent_types import AgentType
+from langchain.output_parsers.fix import OutputFixingParser
 from langchain.callbacks.base import BaseCallbackManager
 from langchain.callbacks.manager import Callbacks
 from langchain.prompts.few_shot import FewShotPromptTemplate
 from langchain.prompts.prompt import PromptTemplate
-from langchain.pydantic_v1 import root_validator
+from langchain.pydantic_v1 import PrivateAttr, root_validator
 from langchain.schema import (
     AgentAction,
     AgentFinish,
@@ -26,15 +33,125 @@ from langchain.tools import BaseTool
 
 from src.chains.llm_chain import LLMChain
 
+try:
+    from yaml import CDumper as YamlDumper
+except ImportError:
+    from yaml import Dumper as YamlDumper
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+_PARTIAL_ACTION_REGEX = re.compile(r"Action\s*:?\s*(.*)", re.DOTALL)
+
+_SUMMARY_CACHE_SIZE = 8
+
+SCRATCHPAD_SUMMARY_PROMPT = (
+    "Summarize the following steps taken by an agent, keeping every fact, "
+    "tool result and decision that may be needed to finish the task.\n\n"
+    "{previous_summary}{steps}\n\nSummary:"
+)
+
+
+def _serialize_observation(observation: Any) -> str:
+    """Serialize an observation deterministically for the scratchpad."""
+    if isinstance(observation, str):
+        return observation
+    try:
+        return json.dumps(observation, sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(observation)
+
+
+def _dump_json(obj: Any) -> bytes:
+    """Serialize to indented JSON, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # orjson is stricter than json (e.g. non-str keys), so fall back.
+            pass
+    # Same format as orjson, so that the file does not depend on it being installed
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+
+
+@dataclass(slots=True, frozen=True)
+class ToolResult:
+    """A step taken by the agent: the tool it called and the observation."""
+
+    log: str
+    """The LLM output that led to the tool call."""
+    observation: str
+    """The serialized output of the tool."""
+    tool: str
+    """The name of the tool."""
+    tool_input: Any
+    """The input of the tool."""
+
+    @classmethod
+    def from_step(cls, step: IntermediateStep) -> ToolResult:
+        """Create from an `(action, observation)` tuple, the legacy step format."""
+        if isinstance(step, ToolResult):
+            return step
+        action, observation = step
+        return cls(
+            log=action.log,
+            observation=_serialize_observation(observation),
+            tool=action.tool,
+            tool_input=action.tool_input,
+        )
+
+
+IntermediateStep = Union[Tuple[AgentAction, Any], ToolResult]
+
+
+def _collapse_repeated_steps(
+    tool_results: Sequence[ToolResult],
+    collapsed: Optional[List[Tuple[ToolResult, int]]] = None,
+) -> List[Tuple[ToolResult, int]]:
+    """Collapse consecutive identical steps (e.g. retry loops) into one.
+
+    Returns the remaining steps along with their number of repetitions.
+    If `collapsed` is given, the steps are collapsed onto it in place.
+    """
+    if collapsed is None:
+        collapsed = []
+    for tool_result in tool_results:
+        if collapsed:
+            last_tool_result, repeats = collapsed[-1]
+            if (
+                last_tool_result.log == tool_result.log
+                and last_tool_result.tool == tool_result.tool
+                and last_tool_result.tool_input == tool_result.tool_input
+                and last_tool_result.observation == tool_result.observation
+            ):
+                collapsed[-1] = (last_tool_result, repeats + 1)
+                continue
+        collapsed.append((tool_result, 1))
+    return collapsed
+
+
+def _last_variable(template: str) -> Optional[str]:
+    """Return the name of the last variable in an f-string template."""
+    variables = [name for _, name, _, _ in Formatter().parse(template) if name]
+    return variables[-1] if variables else None
+
 
 class AgentOutputParser(BaseOutputParser):
     """Base class for parsing agent output into agent action/finish."""
 
     @abstractmethod
-    def parse(self, text: str) -> Union[AgentAction, AgentFinish]:
-        """Parse text into agent action/finish."""
+    def parse(
+        self, text: str
+    ) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        """Parse text into agent action(s)/finish.
+
+        Parsers may return a list of actions when the LLM requested several
+        independent tool calls in a single turn.
+        """
 
 
 class Agent(BaseSingleActionAgent):
@@ -51,6 +168,44 @@ class Agent(BaseSingleActionAgent):
     llm_chain: LLMChain
     output_parser: AgentOutputParser
     allowed_tools: Optional[List[str]] = None
+    enable_parallel_tool_execution: bool = False
+    """Whether to return all actions when the output parser yields several,
+    so that the executor runs all of them (concurrently on the async path).
+    `StructuredChatAgent.from_llm_and_tools` then also lets the LLM request
+    several actions at once. If False, only the first action is returned."""
+    max_scratchpad_steps: Optional[int] = None
+    """The number of most recent steps kept verbatim in the scratchpad.
+    Older steps are replaced by a summary (see `summary_llm`), and consecutive
+    identical steps are collapsed into one. If None (default), all the steps
+    are kept verbatim."""
+    summary_llm: Optional[BaseLanguageModel] = None
+    """A cheap LLM used to summarize the steps that no longer fit in the
+    scratchpad. If None, those steps are omitted."""
+    summary_budget_tokens: int = 1024
+    """The maximum number of tokens of the summary of the older steps."""
+
+    # Rolling hash of a prefix of the steps -> summary of these steps, keeping
+    # only the most recently used summaries since each step adds a new prefix.
+    _summary_cache: OrderedDict[str, str] = PrivateAttr(default_factory=OrderedDict)
+    # Values that are constant for the lifetime of the agent, computed lazily
+    # since the prefixes are only available once the subclass is instantiated.
+    # Stored as tuples and copied on access, since callers mutate the returned
+    # lists (e.g. `LLMChain.generate` appends to the stop sequences).
+    _stop_cache: Optional[Tuple[str, ...]] = PrivateAttr(default=None)
+    _input_keys_cache: Optional[Tuple[str, ...]] = PrivateAttr(default=None)
+    _scratchpad_fragments_cache: Optional[Tuple[str, str]] = PrivateAttr(
+        default=None
+    )
+    # Steps converted by the last `_get_tool_results` call, along with their
+    # conversions, so that only new steps are converted.
+    _tool_results_cache: Optional[
+        Tuple[List[IntermediateStep], List[ToolResult]]
+    ] = PrivateAttr(default=None)
+    # Steps rendered by the last `_construct_scratchpad` call, along with their
+    # collapsed form and rendered strings, so that only new steps are rendered.
+    _scratchpad_cache: Optional[
+        Tuple[List[ToolResult], List[Tuple[ToolResult, int]], List[str]]
+    ] = PrivateAttr(default=None)
 
     @property
     def _agent_type(self) -> str:
@@ -79,29 +234,258 @@ class Agent(BaseSingleActionAgent):
         """Fix the text."""
         raise ValueError("fix_text not implemented for this agent.")
 
+    @property
+    def _repair_parser(self) -> BaseOutputParser:
+        """Return a parser for the repaired outputs that never calls an LLM.
+
+        Parsers with retries (e.g. `StructuredChatOutputParserWithRetries`)
+        would otherwise ask their fixing LLM to fix every failed candidate.
+        """
+        parser = self.output_parser
+        parser = getattr(parser, "base_parser", parser)
+        if isinstance(parser, OutputFixingParser):
+            parser = parser.parser
+        return parser
+
+    def _get_repair_candidates(self, text: str) -> List[str]:
+        """Return the repaired versions of unparsable LLM output to try."""
+        candidates = []
+        try:
+            candidates.append(self._fix_text(text))
+        except ValueError:
+            pass
+        candidates.append("Action: " + text)
+        if (match := _PARTIAL_ACTION_REGEX.search(text)) is not None:
+            candidates.append("Action: " + match.group(1))
+        return candidates
+
+    def _repair_output(
+        self, text: str
+    ) -> Optional[Union[AgentAction, List[AgentAction], AgentFinish]]:
+        """Try to recover an action from unparsable LLM output without an LLM call.
+
+        Returns None if none of the repaired candidates can be parsed.
+        """
+        parser = self._repair_parser
+        for candidate in self._get_repair_candidates(text):
+            try:
+                return parser.parse(candidate)
+            except Exception:
+                continue
+        return None
+
+    async def _arepair_output(
+        self, text: str
+    ) -> Optional[Union[AgentAction, List[AgentAction], AgentFinish]]:
+        """Async version of `_repair_output`."""
+        parser = self._repair_parser
+        for candidate in self._get_repair_candidates(text):
+            try:
+                return await parser.aparse(candidate)
+            except Exception:
+                continue
+        return None
+
     @property
     def _stop(self) -> List[str]:
-        return [
-            f"\n{self.observation_prefix.rstrip()}",
-            f"\n\t{self.observation_prefix.rstrip()}",
-        ]
+        if self._stop_cache is None:
+            self._stop_cache = (
+                f"\n{self.observation_prefix.rstrip()}",
+                f"\n\t{self.observation_prefix.rstrip()}",
+            )
+        return list(self._stop_cache)
+
+    @property
+    def _scratchpad_fragments(self) -> Tuple[str, str]:
+        """Return the strings preceding an observation and the next LLM turn."""
+        if self._scratchpad_fragments_cache is None:
+            self._scratchpad_fragments_cache = (
+                f"\n{self.observation_prefix}",
+                f"\n{self.llm_prefix}",
+            )
+        return self._scratchpad_fragments_cache
 
     def _construct_scratchpad(
-        self, intermediate_steps: List[Tuple[AgentAction, str]]
+        self, intermediate_steps: Sequence[IntermediateStep]
     ) -> Union[str, List[BaseMessage]]:
         """Construct the scratchpad that lets the agent continue its thought process."""
         thoughts = ""
-        for action, observation in intermediate_steps:
-            thoughts += action.log
-            thoughts += f"\n{self.observation_prefix}{observation}\n{self.llm_prefix}"
-        return thoughts
+        tool_results = self._get_tool_results(intermediate_steps)
+        older_results, recent_results = self._split_steps(tool_results)
+        if older_results:
+            if self.summary_llm is not None:
+                summary = self._summarize_steps(older_results)
+                thoughts += f"Prior steps summary: {summary}\n"
+            else:
+                thoughts += f"({len(older_results)} earlier steps omitted)\n"
+        # Between two calls the steps usually only grow by one, so the steps
+        # rendered by the previous call are reused if they are still a prefix.
+        cache = self._scratchpad_cache
+        if (
+            cache is not None
+            and len(cache[0]) <= len(recent_results)
+            and all(map(operator.is_, cache[0], recent_results))
+        ):
+            # Copy the cached lists: the agent may be shared by concurrent runs
+            rendered_results = cache[0]
+            collapsed_results, parts = list(cache[1]), list(cache[2])
+        else:
+            rendered_results, collapsed_results, parts = [], [], []
+        for tool_result in recent_results[len(rendered_results) :]:
+            num_collapsed_results = len(collapsed_results)
+            # Repeated steps are only collapsed when windowing is enabled, so
+            # that the prompt of the other agents is unchanged.
+            if self.max_scratchpad_steps is not None:
+                _collapse_repeated_steps([tool_result], collapsed_results)
+            else:
+                collapsed_results.append((tool_result, 1))
+            part = self._render_step(*collapsed_results[-1])
+            if len(collapsed_results) == num_collapsed_results:
+                # The step repeats the previous one, update its repetitions
+                parts[-1] = part
+            else:
+                parts.append(part)
+        self._scratchpad_cache = (list(recent_results), collapsed_results, parts)
+        return thoughts + "".join(parts)
+
+    def _get_tool_results(
+        self, intermediate_steps: Sequence[IntermediateStep]
+    ) -> List[ToolResult]:
+        """Convert the steps to `ToolResult`s.
+
+        Only the steps added since the previous call are converted, so that the
+        same `ToolResult` objects are returned for the same steps.
+        """
+        cache = self._tool_results_cache
+        if (
+            cache is not None
+            and len(cache[0]) <= len(intermediate_steps)
+            and all(map(operator.is_, cache[0], intermediate_steps))
+        ):
+            converted_steps, tool_results = cache
+        else:
+            converted_steps, tool_results = [], []
+        new_steps = list(intermediate_steps[len(converted_steps) :])
+        # Build new lists rather than extending the cached ones, since the agent
+        # may be shared by concurrent runs that would then see each other's steps.
+        converted_steps = converted_steps + new_steps
+        tool_results = tool_results + [ToolResult.from_step(step) for step in new_steps]
+        self._tool_results_cache = (converted_steps, tool_results)
+        return tool_results
+
+    def _render_step(self, tool_result: ToolResult, repeats: int) -> str:
+        """Render a single step of the scratchpad."""
+        observation_fragment, llm_fragment = self._scratchpad_fragments
+        observation = tool_result.observation
+        if repeats > 1:
+            observation += f" (\u00d7{repeats})"
+        return tool_result.log + observation_fragment + observation + llm_fragment
+
+    def _split_steps(
+        self, tool_results: List[ToolResult]
+    ) -> Tuple[List[ToolResult], List[ToolResult]]:
+        """Split the steps into the older ones to summarize and the recent ones."""
+        if (
+            self.max_scratchpad_steps is None
+            or len(tool_results) <= self.max_scratchpad_steps
+        ):
+            return [], tool_results
+        split = len(tool_results) - self.max_scratchpad_steps
+        return tool_results[:split], tool_results[split:]
+
+    def _get_summary_request(
+        self, tool_results: List[ToolResult]
+    ) -> Tuple[str, Optional[str]]:
+        """Return the cache key of the steps and the prompt to summarize them.
+
+        The summary is rolling: the longest already summarized prefix of the
+        steps is reused, and only the steps after it are sent to the LLM.
+        The prompt is None if the summary of all the steps is already cached.
+        """
+        keys = []
+        rolling_hash = hashlib.sha256()
+        for tool_result in tool_results:
+            fields = (
+                tool_result.tool,
+                json.dumps(tool_result.tool_input, sort_keys=True, default=str),
+                tool_result.log,
+                tool_result.observation,
+            )
+            for field in fields:
+                # Length-prefix the fields so that their boundaries are unambiguous
+                encoded_field = field.encode()
+                rolling_hash.update(len(encoded_field).to_bytes(8, "big"))
+                rolling_hash.update(encoded_field)
+            keys.append(rolling_hash.hexdigest())
+        if keys[-1] in self._summary_cache:
+            self._summary_cache.move_to_end(keys[-1])
+            return keys[-1], None
+
+        previous_summary = ""
+        start = 0
+        for i in range(len(keys) - 2, -1, -1):
+            if keys[i] in self._summary_cache:
+                previous_summary = (
+                    f"Summary so far: {self._summary_cache[keys[i]]}\n\n"
+                )
+                start = i + 1
+                break
+        observation_fragment, _ = self._scratchpad_fragments
+        formatted_steps = "\n".join(
+            tool_result.log + observation_fragment + tool_result.observation
+            for tool_result in tool_results[start:]
+        )
+        prompt = SCRATCHPAD_SUMMARY_PROMPT.format(
+            previous_summary=previous_summary, steps=formatted_steps
+        )
+        return keys[-1], prompt
+
+    def _summarize_steps(self, tool_results: List[ToolResult]) -> str:
+        """Summarize the steps with `summary_llm`, memoizing the result."""
+        key, prompt = self._get_summary_request(tool_results)
+        if prompt is not None:
+            self._cache_summary(
+                key,
+                self.summary_llm.predict(
+                    prompt, max_tokens=self.summary_budget_tokens
+                ).strip(),
+            )
+        return self._summary_cache[key]
+
+    async def _aprepare_summary(
+        self, intermediate_steps: Sequence[IntermediateStep]
+    ) -> None:
+        """Summarize the older steps without blocking the event loop.
+
+        The scratchpad then picks the memoized summary up.
+        """
+        older_results, _ = self._split_steps(self._get_tool_results(intermediate_steps))
+        if older_results and self.summary_llm is not None:
+            await self._asummarize_steps(older_results)
+
+    async def _asummarize_steps(self, tool_results: List[ToolResult]) -> str:
+        """Summarize the steps with `summary_llm`, memoizing the result."""
+        key, prompt = self._get_summary_request(tool_results)
+        if prompt is not None:
+            summary = await self.summary_llm.apredict(
+                prompt, max_tokens=self.summary_budget_tokens
+            )
+            self._cache_summary(key, summary.strip())
+        return self._summary_cache[key]
+
+    def _cache_summary(self, key: str, summary: str) -> None:
+        """Memoize a summary, evicting the least recently used ones."""
+        self._summary_cache[key] = summary
+        self._summary_cache.move_to_end(key)
+        while len(self._summary_cache) > _SUMMARY_CACHE_SIZE:
+            self._summary_cache.popitem(last=False)
 
     def plan(
         self,
-        intermediate_steps: List[Tuple[AgentAction, str]],
+        intermediate_steps: Sequence[IntermediateStep],
         callbacks: Callbacks = None,
         **kwargs: Any,
-    ) -> Union[AgentAction, AgentFinish]:
+    ) -> Union[AgentAction, List[AgentAction], AgentFinish]:
         """Given input, decided what to do.
 
         Args:
@@ -111,25 +495,37 @@ class Agent(BaseSingleActionAgent):
             **kwargs: User inputs.
 
         Returns:
-            Action specifying what tool to use.
+            Action specifying what tool to use, or a list of actions if
+            `enable_parallel_tool_execution` is set and the LLM requested several.
         """
+        full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
+        full_output = self.llm_chain.predict(callbacks=callbacks, **full_inputs)
         try:
-            full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
-            full_output = self.llm_chain.predict(callbacks=callbacks, **full_inputs)
-            return self.output_parser.parse(full_output)
+            agent_output = self.output_parser.parse(full_output)
         except Exception as e:
-            full_inputs["agent_scratchpad"] = (
-                full_inputs["agent_scratchpad"] + full_output + "\nAction: "
-            )
-            full_output = self.llm_chain.predict(callbacks=callbacks, **full_inputs)
-            return self.output_parser.parse("Action: " + full_output)
+            logger.warning(f"Failed to parse the agent output: {e}")
+            agent_output = self._repair_output(full_output)
+            if agent_output is None:
+                # Ask the LLM to continue with an action. The prompt prefix is
+                # unchanged, so the retry is served from the provider's cache.
+                full_inputs["agent_scratchpad"] = (
+                    full_inputs["agent_scratchpad"] + full_output + "\nAction: "
+                )
+                full_output = self.llm_chain.predict(
+                    callbacks=callbacks, **full_inputs
+                )
+                agent_output = self.output_parser.parse("Action: " + full_output)
+
+        if isinstance(agent_output, list) and not self.enable_parallel_tool_execution:
+            return agent_output[0]
+        return agent_output
 
     async def aplan(
         self,
-        intermediate_steps: List[Tuple[AgentAction, str]],
+        intermediate_steps: Sequence[IntermediateStep],
         callbacks: Callbacks = None,
         **kwargs: Any,
-    ) -> Union[AgentAction, AgentFinish]:
+    ) -> Union[AgentAction, List[AgentAction], AgentFinish]:
         """Given input, decided what to do.
 
         Args:
@@ -139,27 +535,36 @@ class Agent(BaseSingleActionAgent):
             **kwargs: User inputs.
 
         Returns:
-            Action specifying what tool to use.
+            Action specifying what tool to use, or a list of actions if
+            `enable_parallel_tool_execution` is set and the LLM requested several.
         """
+        await self._aprepare_summary(intermediate_steps)
+        full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
+        full_output = await self.llm_chain.apredict(callbacks=callbacks, **full_inputs)
         try:
-            full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
-            full_output = await self.llm_chain.apredict(
-                callbacks=callbacks, **full_inputs
-            )
             agent_output = await self.output_parser.aparse(full_output)
         except Exception as e:
-            full_inputs["agent_scratchpad"] = (
-                full_inputs["agent_scratchpad"] + full_output + "\nAction: "
-            )
-            full_output = await self.llm_chain.apredict(
-                callbacks=callbacks, **full_inputs
-            )
-            agent_output = await self.output_parser.aparse("Action: " + full_output)
+            logger.warning(f"Failed to parse the agent output: {e}")
+            agent_output = await self._arepair_output(full_output)
+            if agent_output is None:
+                # Ask the LLM to continue with an action. The prompt prefix is
+                # unchanged, so the retry is served from the provider's cache.
+                full_inputs["agent_scratchpad"] = (
+                    full_inputs["agent_scratchpad"] + full_output + "\nAction: "
+                )
+                full_output = await self.llm_chain.apredict(
+                    callbacks=callbacks, **full_inputs
+                )
+                agent_output = await self.output_parser.aparse(
+                    "Action: " + full_output
+                )
 
+        if isinstance(agent_output, list) and not self.enable_parallel_tool_execution:
+            return agent_output[0]
         return agent_output
 
     def get_full_inputs(
-        self, intermediate_steps: List[Tuple[AgentAction, str]], **kwargs: Any
+        self, intermediate_steps: Sequence[IntermediateStep], **kwargs: Any
     ) -> Dict[str, Any]:
         """Create the full inputs for the LLMChain from intermediate steps."""
         thoughts = self._construct_scratchpad(intermediate_steps)
@@ -173,7 +578,11 @@ class Agent(BaseSingleActionAgent):
 
         :meta private:
         """
-        return list(set(self.llm_chain.input_keys) - {"agent_scratchpad"})
+        if self._input_keys_cache is None:
+            self._input_keys_cache = tuple(
+                set(self.llm_chain.input_keys) - {"agent_scratchpad"}
+            )
+        return list(self._input_keys_cache)
 
     @root_validator()
     def validate_prompt(cls, values: Dict) -> Dict:
@@ -191,6 +600,24 @@ class Agent(BaseSingleActionAgent):
                 prompt.suffix += "\n{agent_scratchpad}"
             else:
                 raise ValueError(f"Got unexpected prompt type {type(prompt)}")
+        # The scratchpad changes on every step, so anything rendered after it
+        # can never be part of a cached prompt prefix.
+        if isinstance(prompt, PromptTemplate):
+            template = prompt.template
+        elif isinstance(prompt, FewShotPromptTemplate):
+            template = prompt.suffix
+        else:
+            template = None
+        # Only f-string templates can be parsed with `string.Formatter`
+        if (
+            template is not None
+            and prompt.template_format == "f-string"
+            and _last_variable(template) != "agent_scratchpad"
+        ):
+            logger.warning(
+                "`agent_scratchpad` should be the last variable in the prompt"
+                " to keep the prompt prefix stable across agent steps."
+            )
         return values
 
     @property
@@ -242,45 +669,85 @@ class Agent(BaseSingleActionAgent):
     def return_stopped_response(
         self,
         early_stopping_method: str,
-        intermediate_steps: List[Tuple[AgentAction, str]],
+        intermediate_steps: Sequence[IntermediateStep],
         **kwargs: Any,
     ) -> AgentFinish:
         """Return response when agent has been stopped due to max iterations."""
+        full_inputs = self._get_final_answer_inputs(
+            early_stopping_method, intermediate_steps, **kwargs
+        )
+        if full_inputs is None:
+            return self._get_forced_stop_response()
+        full_output = self.llm_chain.predict(**full_inputs)
+        # We try to extract a final answer
+        parsed_output = self.output_parser.parse(full_output)
+        return self._get_final_answer(parsed_output, full_output)
+
+    async def areturn_stopped_response(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: Sequence[IntermediateStep],
+        **kwargs: Any,
+    ) -> AgentFinish:
+        """Return response when agent has been stopped due to max iterations."""
+        if early_stopping_method == "generate":
+            await self._aprepare_summary(intermediate_steps)
+        full_inputs = self._get_final_answer_inputs(
+            early_stopping_method, intermediate_steps, **kwargs
+        )
+        if full_inputs is None:
+            return self._get_forced_stop_response()
+        full_output = await self.llm_chain.apredict(**full_inputs)
+        # We try to extract a final answer
+        parsed_output = await self.output_parser.aparse(full_output)
+        return self._get_final_answer(parsed_output, full_output)
+
+    def _get_final_answer_inputs(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: Sequence[IntermediateStep],
+        **kwargs: Any,
+    ) -> Optional[Dict[str, Any]]:
+        """Create the inputs for the final forward pass of a stopped agent.
+
+        Returns None if the agent should not call the LLM (`force` method).
+        """
         if early_stopping_method == "force":
-            # `force` just returns a constant string
-            return AgentFinish(
-                {"output": "Agent stopped due to iteration limit or time limit."}, ""
-            )
+            return None
         elif early_stopping_method == "generate":
             # Generate does one final forward pass
-            thoughts = ""
-            for action, observation in intermediate_steps:
-                thoughts += action.log
-                thoughts += (
-                    f"\n{self.observation_prefix}{observation}\n{self.llm_prefix}"
-                )
+            full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
             # Adding to the previous steps, we now tell the LLM to make a final pred
-            thoughts += (
+            full_inputs["agent_scratchpad"] += (
                 "\n\nI now need to return a final answer based on the previous steps:"
             )
-            new_inputs = {"agent_scratchpad": thoughts, "stop": self._stop}
-            full_inputs = {**kwargs, **new_inputs}
-            full_output = self.llm_chain.predict(**full_inputs)
-            # We try to extract a final answer
-            parsed_output = self.output_parser.parse(full_output)
-            if isinstance(parsed_output, AgentFinish):
-                # If we can extract, we send the correct stuff
-                return parsed_output
-            else:
-                # If we can extract, but the tool is not the final tool,
-                # we just return the full output
-                return AgentFinish({"output": full_output}, full_output)
+            return full_inputs
         else:
             raise ValueError(
                 "early_stopping_method should be one of `force` or `generate`, "
                 f"got {early_stopping_method}"
             )
 
+    @staticmethod
+    def _get_forced_stop_response() -> AgentFinish:
+        # `force` just returns a constant string
+        return AgentFinish(
+            {"output": "Agent stopped due to iteration limit or time limit."}, ""
+        )
+
+    @staticmethod
+    def _get_final_answer(
+        parsed_output: Union[AgentAction, List[AgentAction], AgentFinish],
+        full_output: str,
+    ) -> AgentFinish:
+        if isinstance(parsed_output, AgentFinish):
+            # If we can extract, we send the correct stuff
+            return parsed_output
+        else:
+            # If we can extract, but the tool is not the final tool,
+            # we just return the full output
+            return AgentFinish({"output": full_output}, full_output)
+
     def tool_run_logging_kwargs(self) -> Dict:
         return {
             "llm_prefix": self.llm_prefix,
@@ -312,10 +779,10 @@ class Agent(BaseSingleActionAgent):
         agent_dict = self.dict()
 
         if save_path.suffix == ".json":
-            with open(file_path, "w") as f:
-                json.dump(agent_dict, f, indent=4)
+            with open(file_path, "wb") as f:
+                f.write(_dump_json(agent_dict))
         elif save_path.suffix == ".yaml":
             with open(file_path, "w") as f:
-                yaml.dump(agent_dict, f, default_flow_style=False)
+                yaml.dump(agent_dict, f, Dumper=YamlDumper, default_flow_style=False)
         else:
             raise ValueError(f"{save_path} must be json or yaml")
@@ -1,8 +1,10 @@
+import json
 import re
-from typing import Any, List, Optional, Sequence, Tuple
+from typing import Any, List, Optional, Sequence, Union
 
 from langchain.agents.agent import AgentOutputParser
 from langchain.agents.structured_chat.output_parser import (
+    StructuredChatOutputParser,
     StructuredChatOutputParserWithRetries,
 )
 from langchain.agents.structured_chat.prompt import FORMAT_INSTRUCTIONS, PREFIX, SUFFIX
@@ -13,15 +15,51 @@ from langchain.prompts.chat import (
     SystemMessagePromptTemplate,
 )
 from langchain.pydantic_v1 import Field
-from langchain.schema import AgentAction, BasePromptTemplate
+from langchain.schema import AgentAction, AgentFinish, BasePromptTemplate
 from langchain.schema.language_model import BaseLanguageModel
 from langchain.tools import BaseTool
 
-from src.agents.agent import Agent
+from src.agents.agent import Agent, IntermediateStep
 from src.chains.llm_chain import LLMChain
 
 HUMAN_MESSAGE_TEMPLATE = "{input}\n\n{agent_scratchpad}"
 
+PARALLEL_ACTIONS_INSTRUCTIONS = (
+    "\n\nIf you need several tool calls that do not depend on each other, you may "
+    "instead provide a JSON list of $JSON_BLOBs in a single markdown code snippet, "
+    "and the tools will be run in parallel."
+)
+
+
+class StructuredChatMultiActionOutputParser(StructuredChatOutputParser):
+    """Structured chat output parser that keeps every action of a JSON list.
+
+    The base parser only keeps the first action when the LLM returns a list.
+    """
+
+    def parse(self, text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        action_match = self.pattern.search(text)
+        if action_match is not None:
+            try:
+                response = json.loads(action_match.group(1).strip(), strict=False)
+            except json.JSONDecodeError:
+                response = None
+            if (
+                isinstance(response, list)
+                and len(response) > 1
+                and all(
+                    isinstance(action, dict)
+                    and "action" in action
+                    and action["action"] != "Final Answer"
+                    for action in response
+                )
+            ):
+                return [
+                    AgentAction(action["action"], action.get("action_input", {}), text)
+                    for action in response
+                ]
+        return super().parse(text)
+
 
 class StructuredChatAgent(Agent):
     """Structured Chat Agent."""
@@ -42,7 +80,7 @@ class StructuredChatAgent(Agent):
         return "Thought:"
 
     def _construct_scratchpad(
-        self, intermediate_steps: List[Tuple[AgentAction, str]]
+        self, intermediate_steps: Sequence[IntermediateStep]
     ) -> str:
         agent_scratchpad = super()._construct_scratchpad(intermediate_steps)
         if not isinstance(agent_scratchpad, str):
@@ -62,9 +100,19 @@ class StructuredChatAgent(Agent):
 
     @classmethod
     def _get_default_output_parser(
-        cls, llm: Optional[BaseLanguageModel] = None, **kwargs: Any
+        cls,
+        llm: Optional[BaseLanguageModel] = None,
+        enable_parallel_tool_execution: bool = False,
+        **kwargs: Any,
     ) -> AgentOutputParser:
-        return StructuredChatOutputParserWithRetries.from_llm(llm=llm)
+        base_parser = (
+            StructuredChatMultiActionOutputParser()
+            if enable_parallel_tool_execution
+            else None
+        )
+        return StructuredChatOutputParserWithRetries.from_llm(
+            llm=llm, base_parser=base_parser
+        )
 
     @property
     def _stop(self) -> List[str]:
@@ -116,6 +164,11 @@ class StructuredChatAgent(Agent):
     ) -> Agent:
         """Construct an agent from an LLM and tools."""
         cls._validate_tools(tools)
+        enable_parallel_tool_execution = kwargs.get(
+            "enable_parallel_tool_execution", False
+        )
+        if enable_parallel_tool_execution:
+            format_instructions += PARALLEL_ACTIONS_INSTRUCTIONS
         prompt = cls.create_prompt(
             tools,
             prefix=prefix,
@@ -131,7 +184,9 @@ class StructuredChatAgent(Agent):
             callback_manager=callback_manager,
         )
         tool_names = [tool.name for tool in tools]
-        _output_parser = output_parser or cls._get_default_output_parser(llm=llm)
+        _output_parser = output_parser or cls._get_default_output_parser(
+            llm=llm, enable_parallel_tool_execution=enable_parallel_tool_execution
+        )
         return cls(
             llm_chain=llm_chain,
             allowed_tools=tool_names,
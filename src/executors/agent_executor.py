@@ -23,6 +23,7 @@ from langchain.tools import BaseTool
 from langchain.utilities.asyncio import asyncio_timeout
 from langchain.utils.input import get_color_mapping
 
+from src.agents.agent import Agent
 from src.chains.chain import Chain
 from src.tools.base import BaseTool
 from src.utils.logger_utils import log
@@ -98,6 +99,10 @@ s
     trim_intermediate_steps: Union[
         int, Callable[[List[Tuple[AgentAction, str]]], List[Tuple[AgentAction, str]]]
     ] = -1
+    tool_execution_timeout: Optional[float] = None
+    """The maximum amount of wall clock time a single tool call may take when
+    the agent runs tools in parallel (`enable_parallel_tool_execution`).
+    `None` means no limit."""
 
     @classmethod
     def from_agent_and_tools(
@@ -428,9 +433,32 @@ s
                 )
             return agent_action, observation
 
+        async def _aperform_isolated_agent_action(
+            agent_action: AgentAction,
+        ) -> Tuple[AgentAction, str]:
+            # A failing or hanging tool must not take down its siblings,
+            # so its error is reported back to the LLM as the observation.
+            try:
+                return await asyncio.wait_for(
+                    _aperform_agent_action(agent_action),
+                    timeout=self.tool_execution_timeout,
+                )
+            except asyncio.TimeoutError:
+                return agent_action, (
+                    f"Tool {agent_action.tool} timed out after "
+                    f"{self.tool_execution_timeout} seconds."
+                )
+            except Exception as e:
+                return agent_action, f"Tool {agent_action.tool} failed: {e!r}"
+
+        if getattr(self.agent, "enable_parallel_tool_execution", False):
+            perform_agent_action = _aperform_isolated_agent_action
+        else:
+            perform_agent_action = _aperform_agent_action
+
         # Use asyncio.gather to run multiple tool.arun() calls concurrently
         result = await asyncio.gather(
-            *[_aperform_agent_action(agent_action) for agent_action in actions]
+            *[perform_agent_action(agent_action) for agent_action in actions]
         )
 
         return list(result)
@@ -529,21 +557,36 @@ s
 
                     iterations += 1
                     time_elapsed = time.time() - start_time
-                output = self.agent.return_stopped_response(
-                    self.early_stopping_method, intermediate_steps, **inputs
+                output = await self._areturn_stopped_response(
+                    intermediate_steps, inputs
                 )
                 return await self._areturn(
                     output, intermediate_steps, run_manager=run_manager
                 )
             except TimeoutError:
                 # stop early when interrupted by the async timeout
-                output = self.agent.return_stopped_response(
-                    self.early_stopping_method, intermediate_steps, **inputs
+                output = await self._areturn_stopped_response(
+                    intermediate_steps, inputs
                 )
                 return await self._areturn(
                     output, intermediate_steps, run_manager=run_manager
                 )
 
+    async def _areturn_stopped_response(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        inputs: Dict[str, str],
+    ) -> AgentFinish:
+        """Return the agent response after it has been stopped without blocking
+        the event loop if the agent supports it."""
+        if isinstance(self.agent, Agent):
+            return await self.agent.areturn_stopped_response(
+                self.early_stopping_method, intermediate_steps, **inputs
+            )
+        return self.agent.return_stopped_response(
+            self.early_stopping_method, intermediate_steps, **inputs
+        )
+
     def _get_tool_return(
         self, next_step_output: Tuple[AgentAction, str]
     ) -> Optional[AgentFinish]:
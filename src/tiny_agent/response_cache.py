@@ -0,0 +1,261 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Sequence
+
+import numpy as np
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+
+from src.tools.base import StructuredTool, Tool
+
+# Pleasantries are only stripped as whole words delimited by whitespace or punctuation
+_PLEASANTRIES_REGEX = re.compile(
+    r"^(?:(?:hi|hey|hello|please|kindly)(?:[\s,!.]+|$))+"
+    r"|(?:(?:^|[\s,!.]+)(?:please|thanks|thank you|thx))+[\s,!.]*$"
+)
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes the query so that trivially different phrasings of the same request
+    (case, whitespace, pleasantries) map to the same cache entry.
+    """
+    query = _WHITESPACE_REGEX.sub(" ", query.lower()).strip()
+    return _PLEASANTRIES_REGEX.sub("", query).strip()
+
+
+def get_tools_signature(tools: Sequence[Tool | StructuredTool]) -> str:
+    """
+    Returns a stable hash of the tool names and schemas. Any change to the tools
+    invalidates all the responses that were cached with the previous tools.
+    """
+    schema = sorted(
+        (tool.name, tool.description, json.dumps(tool.args, sort_keys=True))
+        for tool in tools
+    )
+    return hashlib.sha256(json.dumps(schema).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-level cache of the final TinyAgent responses.
+
+    The first level is an exact match on the normalized query, kept in an in-memory
+    LRU and optionally persisted to SQLite. The second level, enabled when an embedding
+    model is given, returns the response of the most similar cached query if their
+    cosine similarity is above the threshold.
+
+    Note that a cache hit skips the whole agent trajectory, including the tool calls
+    and their side effects (e.g. creating a note), hence the cache is opt-in. Responses
+    expire after an hour by default so that answers depending on the state of the
+    device (e.g. transient tool errors) are not replayed forever. Queries that are
+    empty once normalized (e.g. "Thanks") are never cached.
+    """
+
+    _DEFAULT_MAX_SIZE = 256
+    _DEFAULT_TTL = 60 * 60
+    _DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+    _max_size: int
+    _ttl: float | None
+    _similarity_threshold: float
+    _embedding_model: (
+        AzureOpenAIEmbeddings | OpenAIEmbeddings | HuggingFaceEmbeddings | None
+    )
+    # key -> (response, created_at, normalized query embedding)
+    _entries: OrderedDict[str, tuple[str, float, np.ndarray | None]]
+    # Identifies the embedding model, so that the embeddings persisted with another
+    # model (possibly of another dimension) are never compared to the new ones.
+    _embedding_model_id: str | None
+    _connection: sqlite3.Connection | None
+
+    def __init__(
+        self,
+        max_size: int = _DEFAULT_MAX_SIZE,
+        ttl: float | None = _DEFAULT_TTL,
+        db_path: str | None = None,
+        embedding_model: (
+            AzureOpenAIEmbeddings | OpenAIEmbeddings | HuggingFaceEmbeddings | None
+        ) = None,
+        similarity_threshold: float = _DEFAULT_SIMILARITY_THRESHOLD,
+    ) -> None:
+        """
+        Args:
+            max_size: Maximum number of responses kept in memory.
+            ttl: Time to live of a response in seconds. If None, responses never expire.
+            db_path: Path of the SQLite database to persist the responses to.
+                If None, the cache is in-memory only.
+            embedding_model: Embedding model for the semantic lookup.
+                If None, only exact matches are returned.
+            similarity_threshold: Minimum cosine similarity for a semantic hit.
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._similarity_threshold = similarity_threshold
+        self._embedding_model = embedding_model
+        self._embedding_model_id = (
+            self._get_embedding_model_id(embedding_model)
+            if embedding_model is not None
+            else None
+        )
+        self._entries = OrderedDict()
+        self._connection = None
+
+        if db_path is not None:
+            self._connection = sqlite3.connect(db_path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT, created_at REAL, "
+                "embedding TEXT, embedding_model TEXT)"
+            )
+            self._load()
+
+    async def aget(self, query: str, tools_signature: str) -> str | None:
+        normalized_query = normalize_query(query)
+        if len(normalized_query) == 0:
+            return None
+
+        key = self._get_key(normalized_query, tools_signature)
+        self._evict_expired()
+
+        if (entry := self._entries.get(key)) is not None:
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        if self._embedding_model is None or len(self._entries) == 0:
+            return None
+
+        embedding = await self._aembed(normalized_query)
+        best_key, best_similarity = None, self._similarity_threshold
+        for entry_key, (_, _, entry_embedding) in self._entries.items():
+            # Responses computed with other tools must not be reused.
+            if entry_embedding is None or not entry_key.startswith(tools_signature):
+                continue
+            similarity = float(np.dot(embedding, entry_embedding))
+            if similarity >= best_similarity:
+                best_key, best_similarity = entry_key, similarity
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][0]
+
+    async def aset(self, query: str, tools_signature: str, response: str) -> None:
+        normalized_query = normalize_query(query)
+        if len(normalized_query) == 0:
+            return
+
+        key = self._get_key(normalized_query, tools_signature)
+        embedding = (
+            await self._aembed(normalized_query)
+            if self._embedding_model is not None
+            else None
+        )
+        created_at = time.time()
+        self._entries[key] = (response, created_at, embedding)
+        self._entries.move_to_end(key)
+        evicted_keys = []
+        while len(self._entries) > self._max_size:
+            evicted_keys.append(self._entries.popitem(last=False)[0])
+
+        if self._connection is not None:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response,
+                    created_at,
+                    json.dumps(embedding.tolist()) if embedding is not None else None,
+                    self._embedding_model_id,
+                ),
+            )
+            # Evicted responses would never be loaded again, so they are deleted.
+            self._connection.executemany(
+                "DELETE FROM responses WHERE key = ?",
+                [(evicted_key,) for evicted_key in evicted_keys],
+            )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        if self._connection is not None:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def _get_key(normalized_query: str, tools_signature: str) -> str:
+        query_hash = hashlib.sha256(normalized_query.encode()).hexdigest()
+        return f"{tools_signature}:{query_hash}"
+
+    @staticmethod
+    def _get_embedding_model_id(
+        embedding_model: (
+            AzureOpenAIEmbeddings | OpenAIEmbeddings | HuggingFaceEmbeddings
+        ),
+    ) -> str:
+        model_name = getattr(embedding_model, "model_name", None) or getattr(
+            embedding_model, "model", None
+        )
+        return f"{type(embedding_model).__name__}:{model_name}"
+
+    async def _aembed(self, normalized_query: str) -> np.ndarray:
+        assert self._embedding_model is not None
+        embedding = np.asarray(
+            await self._embedding_model.aembed_query(normalized_query),
+            dtype=np.float32,
+        )
+        return embedding / np.linalg.norm(embedding)
+
+    def _evict_expired(self) -> None:
+        if self._ttl is None:
+            return
+        expired_before = time.time() - self._ttl
+        expired_keys = [
+            key
+            for key, (_, created_at, _) in self._entries.items()
+            if created_at < expired_before
+        ]
+        for key in expired_keys:
+            del self._entries[key]
+        if self._connection is not None and len(expired_keys) > 0:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (expired_before,)
+            )
+            self._connection.commit()
+
+    def _load(self) -> None:
+        assert self._connection is not None
+        rows = self._connection.execute(
+            "SELECT key, response, created_at, embedding, embedding_model "
+            "FROM responses ORDER BY created_at DESC LIMIT ?",
+            (self._max_size,),
+        ).fetchall()
+        for key, response, created_at, embedding, embedding_model_id in reversed(rows):
+            # Embeddings of another model only serve exact matches
+            self._entries[key] = (
+                response,
+                created_at,
+                (
+                    np.asarray(json.loads(embedding), dtype=np.float32)
+                    if embedding is not None
+                    and embedding_model_id == self._embedding_model_id
+                    else None
+                ),
+            )
+        # The responses that do not fit in memory would never be read again
+        if len(rows) > 0 and len(rows) == self._max_size:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (rows[-1][2],)
+            )
+            self._connection.commit()
+        self._evict_expired()
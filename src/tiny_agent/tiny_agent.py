@@ -1,3 +1,6 @@
+import asyncio
+import copy
+
 from src.llm_compiler.constants import END_OF_PLAN, SUMMARY_RESULT
 from src.llm_compiler.llm_compiler import LLMCompiler
 from src.llm_compiler.planner import generate_llm_compiler_prompt
@@ -10,6 +13,7 @@ from src.tiny_agent.prompts import (
     PLANNER_PROMPT_REPLAN,
     get_planner_custom_instructions_prompt,
 )
+from src.tiny_agent.response_cache import ResponseCache, get_tools_signature
 from src.tiny_agent.sub_agents.compose_email_agent import ComposeEmailAgent
 from src.tiny_agent.sub_agents.notes_agent import NotesAgent
 from src.tiny_agent.sub_agents.pdf_summarizer_agent import PDFSummarizerAgent
@@ -19,11 +23,17 @@ from src.tiny_agent.tiny_agent_tools import (
 )
 from src.tiny_agent.tool_rag.base_tool_rag import BaseToolRAG
 from src.tiny_agent.tool_rag.classifier_tool_rag import ClassifierToolRAG
-from src.utils.model_utils import get_embedding_model, get_model
+from src.utils.model_utils import (
+    acquire_shared_http_async_client,
+    arelease_shared_http_async_client,
+    get_embedding_model,
+    get_model,
+)
 
 
 class TinyAgent:
     _DEFAULT_TOP_K = 6
+    _DEFAULT_MAX_CONCURRENCY = 8
 
     config: TinyAgentConfig
     agent: LLMCompiler
@@ -32,12 +42,22 @@ class TinyAgent:
     pdf_summarizer_agent: PDFSummarizerAgent
     compose_email_agent: ComposeEmailAgent
     tool_rag: BaseToolRAG
+    response_cache: ResponseCache | None
+    # TinyAgents that share the models and ToolRAG of this one, but own the
+    # per-query state, so that `abatch` can run several queries concurrently
+    _workers: list["TinyAgent"]
 
-    def __init__(self, config: TinyAgentConfig) -> None:
+    def __init__(
+        self, config: TinyAgentConfig, response_cache: ResponseCache | None = None
+    ) -> None:
         self.config = config
+        self.response_cache = response_cache
+        # Reuse the HTTP connections of the other TinyAgents of the event loop
+        self._http_async_client = acquire_shared_http_async_client()
+        http_async_client = self._http_async_client
 
         # Define the models
-        llm = get_model(
+        self._llm = get_model(
             model_type=config.llmcompiler_config.model_type.value,
             model_name=config.llmcompiler_config.model_name,
             api_key=config.llmcompiler_config.api_key,
@@ -47,8 +67,9 @@ class TinyAgent:
             azure_api_version=config.azure_api_version,
             azure_endpoint=config.azure_endpoint,
             azure_deployment=config.llmcompiler_config.model_name,
+            http_async_client=http_async_client,
         )
-        planner_llm = get_model(
+        self._planner_llm = get_model(
             model_type=config.llmcompiler_config.model_type.value,
             model_name=config.llmcompiler_config.model_name,
             api_key=config.llmcompiler_config.api_key,
@@ -58,8 +79,9 @@ class TinyAgent:
             azure_api_version=config.azure_api_version,
             azure_endpoint=config.azure_endpoint,
             azure_deployment=config.llmcompiler_config.model_name,
+            http_async_client=http_async_client,
         )
-        sub_agent_llm = get_model(
+        self._sub_agent_llm = get_model(
             model_type=config.sub_agent_config.model_type.value,
             model_name=config.sub_agent_config.model_name,
             api_key=config.sub_agent_config.api_key,
@@ -69,17 +91,45 @@ class TinyAgent:
             azure_api_version=config.azure_api_version,
             azure_endpoint=config.azure_endpoint,
             azure_deployment=config.sub_agent_config.model_name,
+            http_async_client=http_async_client,
         )
 
         self.computer = Computer()
         self.notes_agent = NotesAgent(
-            sub_agent_llm, config.sub_agent_config, config.custom_instructions
+            self._sub_agent_llm, config.sub_agent_config, config.custom_instructions
         )
+        self._workers = []
+        self._init_query_state()
+
+        # Define ToolRAG
+        if config.embedding_model_config is not None:
+            embedding_model = get_embedding_model(
+                model_type=config.embedding_model_config.model_type.value,
+                model_name=config.embedding_model_config.model_name,
+                api_key=config.embedding_model_config.api_key,
+                azure_endpoint=config.azure_endpoint,
+                azure_embedding_deployment=config.embedding_model_config.model_name,
+                azure_api_version=config.azure_api_version,
+                local_port=config.embedding_model_config.port,
+                context_length=config.embedding_model_config.context_length,
+            )
+            self.tool_rag = ClassifierToolRAG(
+                embedding_model=embedding_model,
+                tools=self._tools,
+            )
+
+    def _init_query_state(self) -> None:
+        """
+        Creates the components whose state changes with every query: the sub-agents
+        that keep the query or its result, and the LLMCompiler whose system prompt
+        is set from the ToolRAG results. The tools are bound to these sub-agents.
+        """
+        config = self.config
         self.pdf_summarizer_agent = PDFSummarizerAgent(
-            sub_agent_llm, config.sub_agent_config, config.custom_instructions
+            self._sub_agent_llm, config.sub_agent_config, config.custom_instructions
         )
         self.compose_email_agent = ComposeEmailAgent(
-            sub_agent_llm, config.sub_agent_config, config.custom_instructions
+            self._sub_agent_llm, config.sub_agent_config, config.custom_instructions
         )
 
         tools = get_tiny_agent_tools(
@@ -90,11 +140,13 @@ class TinyAgent:
             tool_names=get_tool_names_from_apps(config.apps),
             zoom_access_token=config.zoom_access_token,
         )
+        self._tools = tools
+        self._tools_signature = get_tools_signature(tools)
 
         # Define LLMCompiler
         self.agent = LLMCompiler(
             tools=tools,
-            planner_llm=planner_llm,
+            planner_llm=self._planner_llm,
             planner_custom_instructions_prompt=get_planner_custom_instructions_prompt(
                 tools=tools, custom_instructions=config.custom_instructions
             ),
@@ -102,31 +154,82 @@ class TinyAgent:
             planner_example_prompt_replan=PLANNER_PROMPT_REPLAN,
             planner_stop=[END_OF_PLAN],
             planner_stream=True,
-            agent_llm=llm,
+            agent_llm=self._llm,
             joinner_prompt=OUTPUT_PROMPT,
             joinner_prompt_final=OUTPUT_PROMPT_FINAL,
             max_replans=2,
             benchmark=False,
         )
 
-        # Define ToolRAG
-        if config.embedding_model_config is not None:
-            embedding_model = get_embedding_model(
-                model_type=config.embedding_model_config.model_type.value,
-                model_name=config.embedding_model_config.model_name,
-                api_key=config.embedding_model_config.api_key,
-                azure_endpoint=config.azure_endpoint,
-                azure_embedding_deployment=config.embedding_model_config.model_name,
-                azure_api_version=config.azure_api_version,
-                local_port=config.embedding_model_config.port,
-                context_length=config.embedding_model_config.context_length,
-            )
-            self.tool_rag = ClassifierToolRAG(
-                embedding_model=embedding_model,
-                tools=tools,
-            )
+    def _create_worker(self) -> "TinyAgent":
+        """
+        Creates a TinyAgent that shares the models, the computer, the notes agent,
+        the ToolRAG and the response cache with this one, and owns its per-query state.
+        """
+        worker = copy.copy(self)
+        worker._workers = []
+        worker._init_query_state()
+        return worker
 
     async def arun(self, query: str) -> str:
+        if self.response_cache is not None:
+            cached_result = await self.response_cache.aget(
+                query, self._tools_signature
+            )
+            if cached_result is not None:
+                return cached_result
+
+        result = await self._arun(query)
+
+        if self.response_cache is not None:
+            await self.response_cache.aset(query, self._tools_signature, result)
+
+        return result
+
+    async def abatch(
+        self, queries: list[str], max_concurrency: int = _DEFAULT_MAX_CONCURRENCY
+    ) -> list[str | BaseException]:
+        """
+        Runs the queries concurrently and returns their results in the same order.
+        If a query fails, its exception is returned in place of its result.
+
+        `arun` mutates per-query state (e.g. the planner's system prompt), hence each
+        concurrent run uses its own worker. The workers share the models and the ToolRAG
+        with this TinyAgent and are kept for the subsequent calls. Note that the
+        streamed tokens of the concurrent runs are interleaved in the streaming queue.
+        """
+        num_workers = max(1, min(max_concurrency, len(queries)))
+        while len(self._workers) < num_workers - 1:
+            self._workers.append(self._create_worker())
+        idle_agents = asyncio.Queue[TinyAgent]()
+        idle_agents.put_nowait(self)
+        for worker in self._workers[: num_workers - 1]:
+            idle_agents.put_nowait(worker)
+
+        async def _arun_one(query: str) -> str:
+            tiny_agent = await idle_agents.get()
+            try:
+                return await tiny_agent.arun(query)
+            finally:
+                idle_agents.put_nowait(tiny_agent)
+
+        return await asyncio.gather(
+            *(_arun_one(query) for query in queries), return_exceptions=True
+        )
+
+    async def aclose(self) -> None:
+        """
+        Releases this TinyAgent's reference to the shared HTTP client, which is
+        closed once no TinyAgent of the event loop uses it anymore, and closes
+        the response cache.
+        """
+        if self._http_async_client is not None:
+            await arelease_shared_http_async_client(self._http_async_client)
+            self._http_async_client = None
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+    async def _arun(self, query: str) -> str:
         if self.config.embedding_model_config is not None:
             tool_rag_results = self.tool_rag.retrieve_examples_and_tools(
                 query, top_k=TinyAgent._DEFAULT_TOP_K
@@ -1,3 +1,9 @@
+import asyncio
+import importlib.util
+import weakref
+
+import httpx
+import openai
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 from langchain.llms import OpenAI
 from langchain_community.embeddings import HuggingFaceEmbeddings
@@ -7,6 +13,91 @@ from src.utils.logger_utils import log
 
 DEFAULT_SAFE_CONTEXT_LENGTH = 512
 DEFAULT_SENTENCE_TRANSFORMER_BATCH_SIZE = 128
+DEFAULT_HTTP_MAX_CONNECTIONS = 100
+DEFAULT_HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+
+# HTTP clients shared by the async LLM clients of each event loop, so that the
+# connections (and their TLS sessions) are reused across models and agents.
+# A client is bound to the loop it was created in, and is reference counted
+# so that it is only closed once the last user releases it.
+_shared_http_async_clients: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, list[httpx.AsyncClient | int]
+] = weakref.WeakKeyDictionary()
+
+
+def acquire_shared_http_async_client() -> httpx.AsyncClient | None:
+    """
+    Returns the HTTP client shared within the running event loop and increments its
+    reference count. Returns None outside of an event loop, in which case the
+    LLM clients create their own HTTP client.
+    Every acquired client must be released with `arelease_shared_http_async_client`.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+    entry = _shared_http_async_clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = httpx.AsyncClient(
+            # HTTP/2 requires the optional `h2` package
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=DEFAULT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=DEFAULT_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+        entry = [client, 0]
+        _shared_http_async_clients[loop] = entry
+    entry[1] += 1
+    return entry[0]
+
+
+async def arelease_shared_http_async_client(client: httpx.AsyncClient) -> None:
+    """
+    Decrements the reference count of a shared HTTP client and closes it once
+    it is no longer used.
+    """
+    for loop, entry in list(_shared_http_async_clients.items()):
+        if entry[0] is not client:
+            continue
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _shared_http_async_clients[loop]
+            await client.aclose()
+        return
+
+
+def _get_async_client(
+    llm: ChatOpenAI | AzureChatOpenAI | OpenAI, http_async_client: httpx.AsyncClient
+):
+    """
+    Builds the async OpenAI client of the given LLM on top of the given HTTP client.
+    The sync client is left untouched since it requires an `httpx.Client`.
+    """
+    if isinstance(llm, AzureChatOpenAI):
+        return openai.AsyncAzureOpenAI(
+            api_version=llm.openai_api_version,
+            azure_endpoint=llm.azure_endpoint,
+            azure_deployment=llm.deployment_name,
+            api_key=llm.openai_api_key,
+            timeout=llm.request_timeout,
+            max_retries=llm.max_retries,
+            http_client=http_async_client,
+        ).chat.completions
+
+    client = openai.AsyncOpenAI(
+        api_key=llm.openai_api_key,
+        organization=llm.openai_organization,
+        base_url=llm.openai_api_base,
+        timeout=llm.request_timeout,
+        max_retries=llm.max_retries,
+        http_client=http_async_client,
+    )
+    if isinstance(llm, ChatOpenAI):
+        return client.chat.completions
+    return client.completions
 
 
 def get_model(
@@ -19,6 +110,7 @@ def get_model(
     azure_endpoint=None,
     azure_deployment=None,
     azure_api_version=None,
+    http_async_client=None,
 ):
     if model_type == "openai":
         if api_key is None:
@@ -77,6 +169,9 @@ def get_model(
     else:
         raise NotImplementedError(f"Unknown model type: {model_type}")
 
+    if http_async_client is not None:
+        llm.async_client = _get_async_client(llm, http_async_client)
+
     return llm
 
 